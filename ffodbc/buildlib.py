@@ -74,11 +74,15 @@ ffi.cdef("""typedef struct Cursor {
     SQLHSTMT handle;
     cursor_state state;
     SQLULEN arraysize;
+    SQLULEN outputsize;
     SQLSMALLINT numcols;
+    SQLSMALLINT numparams;
     SQLCOLUMN *firstcol;
     SQLLEN rowcount;
     SQLULEN rows_fetched;
     SQLUSMALLINT *row_status;
+    int async_enabled;
+    int async_on;
 } SQLCURSOR;
 """)
 
@@ -103,6 +107,29 @@ ffi.cdef("""
     int cursor_execdirect(SQLCURSOR *cursor, SQLWCHAR *stmt, SQLLEN stmtlen);
 """)
 ffi.cdef("int cursor_fetch(SQLCURSOR *cursor);")
+ffi.cdef("""
+    int cursor_prepare(SQLCURSOR *cursor, SQLWCHAR *stmt, SQLLEN stmtlen);
+""")
+ffi.cdef("""
+    int bind_parameter(SQLCURSOR *cursor, SQLUSMALLINT index,
+                       SQLSMALLINT c_type, SQLSMALLINT sql_type, SQLULEN size,
+                       SQLSMALLINT decimal_digits, SQLPOINTER value,
+                       SQLLEN buffer_length, SQLLEN *indicator);
+""")
+ffi.cdef("""
+    int describe_parameter(SQLCURSOR *cursor, SQLUSMALLINT index,
+                           SQLSMALLINT *sql_type, SQLULEN *size,
+                           SQLSMALLINT *decimal_digits);
+""")
+ffi.cdef("int cursor_execute(SQLCURSOR *cursor);")
+ffi.cdef("""
+    int cursor_execdirect_poll(SQLCURSOR *cursor, SQLWCHAR *stmt,
+                               SQLLEN stmtlen);
+""")
+ffi.cdef("int cursor_execute_poll(SQLCURSOR *cursor);")
+ffi.cdef("int cursor_set_async(SQLCURSOR *cursor, int enabled);")
+ffi.cdef("int cursor_set_timeout(SQLCURSOR *cursor, SQLULEN timeout);")
+ffi.cdef("int cursor_cancel(SQLCURSOR *cursor);")
 ffi.cdef("ODBCERROR *extract_error(SQLHANDLE handle, SQLSMALLINT type);")
 
 loc = os.path.dirname(os.path.abspath(__file__))
@@ -1,11 +1,17 @@
-import datetime
-from collections import namedtuple
+import struct
+import time
+from collections import namedtuple, OrderedDict
 from decimal import Decimal
 
 from ffodbc._ffodbc import lib, ffi
-from ffodbc.exceptions import ProgrammingError
-from ffodbc.sqltypes import TYPEMAP
-from ffodbc.tools import _raise_error, unmarshal_date, unmarshal_datetime
+from ffodbc.exceptions import (ProgrammingError, NotSupportedError,
+                               DatabaseError)
+from ffodbc.params import ParamDescription, Statement, prepare_parameter
+from ffodbc.sharedmem import write_rowset
+from ffodbc.sqltypes import (TYPEMAP, CTYPE_FORMATS, SQL_C_WCHAR,
+                             SQL_C_BINARY, SQL_NULL_DATA, SQL_STILL_EXECUTING)
+from ffodbc.tools import (_raise_error, decode_fixed, read_indicators,
+                          varlen_stride, check_truncation)
 
 
 ColumnDescription = namedtuple('ColumnDescription', [
@@ -13,6 +19,9 @@ ColumnDescription = namedtuple('ColumnDescription', [
     'internal_size', 'precision', 'scale', 'null_ok'
 ])
 
+# number of statements whose parameter bindings are kept per cursor
+STATEMENT_CACHE_SIZE = 20
+
 
 class Cursor(object):
     def __init__(self, connection):
@@ -23,6 +32,17 @@ class Cursor(object):
         self._arraysize = 1
         self._rowptr = 0
         self._rows_fetched = 0
+        self._rowset = None
+
+        self._statement = None
+        self._statements = OrderedDict()
+        self._params = []
+        self._declared = []
+        self._inputsizes = None
+
+        self._asynchronous = False
+        self._timeout = 0
+        self._pending = None
 
         self.description = None
 
@@ -30,10 +50,13 @@ class Cursor(object):
     def rowcount(self):
         return self._cursor.rowcount
 
-    def _call(self, ret):
-        """Call an ODBC function and handle errors."""
+    def _check_opened(self):
         if self._opened is False:
             raise ProgrammingError("Calling on a closed cursor")
+
+    def _call(self, ret):
+        """Call an ODBC function and handle errors."""
+        self._check_opened()
         if ret not in (0, 1):
             error = lib.extract_error(self._cursor.handle, 3)
             if error:
@@ -60,9 +83,19 @@ class Cursor(object):
     def close(self):
         """Close the cursor now."""
         if self._opened:
-            self._call(lib.close_cursor(self._cursor))
+            cursor = self._cursor
+            pending = self._pending
             self._cursor = ffi.NULL
             self._opened = False
+            self._pending = None
+            if pending is not None:
+                # the statement handle cannot be freed until the
+                # cancelled statement has actually stopped
+                poll, args, keepalive = pending
+                lib.cursor_cancel(cursor)
+                while poll(*args) == SQL_STILL_EXECUTING:
+                    time.sleep(0.001)
+            lib.close_cursor(cursor)
 
     def _set_description(self):
         description = []
@@ -82,32 +115,269 @@ class Cursor(object):
             col = col.next
         self.description = description
 
-    def execute(self, operation, parameters=None):
-        """Execute a statement."""
+    def _prepare(self, operation):
+        """Prepare a statement unless it is the one already prepared.
+
+        The cursor has a single statement handle, so switching statements
+        prepares again. The parameters of the last STATEMENT_CACHE_SIZE
+        statements are kept and bound again, along with their declared
+        input sizes, instead of being inferred from scratch.
+        """
+        if operation == self._statement:
+            return
+        statement = self._statements.pop(operation, None)
         c_stmt = ffi.new('char[]', operation.encode('utf-16-le'))
+        self._statement = None
+        self._call(lib.cursor_prepare(self._cursor, ffi.cast('SQLWCHAR*',
+                                      c_stmt), len(operation)))
+        self._statement = operation
+
+        numparams = self._cursor.numparams
+        if statement is None or len(statement.params) != numparams:
+            statement = Statement(numparams)
+        self._statements[operation] = statement
+        if len(self._statements) > STATEMENT_CACHE_SIZE:
+            self._statements.popitem(last=False)
+        self._params = statement.params
+        self._declared = statement.declared
+        for i, param in enumerate(self._params):
+            if param is not None:
+                self._call(param.bind(self._cursor, i + 1))
+
+    def _describe_parameter(self, index):
+        """Ask the driver for the description of a parameter marker.
+
+        Returns None if the driver cannot describe it.
+        """
+        sql_type = ffi.new('SQLSMALLINT*')
+        size = ffi.new('SQLULEN*')
+        decimal_digits = ffi.new('SQLSMALLINT*')
+        ret = lib.describe_parameter(self._cursor, index, sql_type, size,
+                                     decimal_digits)
+        if ret not in (0, 1):
+            return None
+        return ParamDescription(sql_type[0], max(size[0], 1),
+                                decimal_digits[0])
+
+    def _bind_parameters(self, parameters):
+        """Copy the values into the bound buffers, rebinding if needed."""
+        if len(parameters) != len(self._params):
+            raise ProgrammingError(
+                "Statement has {} parameters, {} given".format(
+                    len(self._params), len(parameters)))
+        if self._inputsizes is not None:
+            inputsizes = self._inputsizes[:len(self._params)]
+            for i, inputsize in enumerate(inputsizes):
+                self._declared[i] = inputsize
+            self._inputsizes = None
+        for i, value in enumerate(parameters):
+            inputsize = self._declared[i]
+            if value is None and self._params[i] is None and \
+                    not isinstance(inputsize, tuple):
+                # the type of a leading NULL cannot be inferred
+                inputsize = self._describe_parameter(i + 1) or inputsize
+            param = prepare_parameter(self._params[i], value, inputsize)
+            if param is not None:
+                self._call(param.bind(self._cursor, i + 1))
+                self._params[i] = param
+
+    def execute(self, operation, parameters=None):
+        """Execute a statement.
+
+        Statements with parameters are prepared once and the parameter
+        buffers stay bound, so executing the same statement again only
+        copies the new values.
+        """
+        self._check_pending()
         if parameters is None:
-            self._call(lib.cursor_execdirect(self._cursor, ffi.cast('SQLWCHAR*',
-                                            c_stmt), len(operation)))
+            c_stmt = ffi.new('char[]', operation.encode('utf-16-le'))
+            self._statement = None
+            self._execute(lib.cursor_execdirect, lib.cursor_execdirect_poll,
+                          self._cursor, ffi.cast('SQLWCHAR*', c_stmt),
+                          len(operation), keepalive=c_stmt)
         else:
-            raise NotImplementedError("Parameterized queries not implemented")
-        self._set_description()
+            self._prepare(operation)
+            self._bind_parameters(parameters)
+            self._execute(lib.cursor_execute, lib.cursor_execute_poll,
+                          self._cursor)
         return self
 
+    def _execute(self, func, poll, *args, keepalive=None):
+        """Run an execute function, or leave it pending in async mode.
+
+        A pending execute is finished by calling poll with the same
+        arguments; keepalive holds the buffers those arguments point to.
+        """
+        ret = func(*args)
+        if ret == SQL_STILL_EXECUTING:
+            self._pending = (poll, args, keepalive)
+            return
+        self._finish_execute(ret)
+
+    def _finish_execute(self, ret):
+        """Handle the result of an execute and forget the previous rows."""
+        self._call(ret)
+        self._rowptr = 0
+        self._rows_fetched = 0
+        self._rowset = None
+        self._set_description()
+
+    def _check_pending(self):
+        if self._pending is not None:
+            raise ProgrammingError("Statement is still executing, poll first")
+
+    def poll(self):
+        """Check on a statement executing asynchronously.
+
+        Returns True once the statement has finished, raising any error
+        it ran into, and False while it is still executing.
+        """
+        if self._pending is None:
+            return True
+        poll, args, keepalive = self._pending
+        ret = poll(*args)
+        if ret == SQL_STILL_EXECUTING:
+            return False
+        self._pending = None
+        self._finish_execute(ret)
+        return True
+
+    def cancel(self):
+        """Cancel the statement executing on this cursor.
+
+        This may be called from another thread. A cancelled statement
+        raises OperationalError from execute or poll.
+        """
+        self._check_opened()
+        self._call(lib.cursor_cancel(self._cursor))
+
+    @property
+    def asynchronous(self):
+        """In asynchronous mode execute returns while the statement runs.
+
+        Call poll until it returns True before fetching the results,
+        which lets one thread drive statements on many connections.
+        """
+        return self._asynchronous
+
+    @asynchronous.setter
+    def asynchronous(self, value):
+        self._check_opened()
+        self._check_pending()
+        self._call(lib.cursor_set_async(self._cursor, int(bool(value))))
+        self._asynchronous = bool(value)
+
+    @property
+    def timeout(self):
+        """Seconds a statement may run before it is cancelled, 0 to disable."""
+        return self._timeout
+
+    @timeout.setter
+    def timeout(self, value):
+        if not isinstance(value, int):
+            raise TypeError('Timeout must be type int >= 0')
+        if value < 0:
+            raise ValueError('Timeout must be >= 0')
+        self._check_opened()
+        self._call(lib.cursor_set_timeout(self._cursor, value))
+        self._timeout = value
+
     def executemany(self, operation, seq_of_parameters):
         """Execute a statement with a sequence of parameters."""
+        if self._asynchronous:
+            raise NotSupportedError("executemany is not supported in "
+                                    "asynchronous mode")
         for parameters in seq_of_parameters:
             self.execute(operation, parameters)
         return self
 
     def _internal_fetch(self):
+        """Make sure the current rowset has unread rows.
+
+        Returns False at the end of the data, or when the statement
+        did not produce a result set at all.
+        """
+        self._check_pending()
+        if not self.description:
+            return False
         mv = min(self.arraysize, self._rows_fetched)
         if self._rowptr >= mv:
             self._rowptr = 0
             self._rows_fetched = 0
         if self._rowptr == 0:
-            ret = self._call(lib.cursor_fetch(self._cursor))
+            self._rowset = None  # release the decoded rows before fetching
+            ret = lib.cursor_fetch(self._cursor)
+            if ret != 0:
+                self._rows_fetched = 0
+            self._call(ret)
+            if ret not in (0, 1):  # an error without a diagnostic record
+                raise DatabaseError("Fetch failed with return code {}"
+                                    .format(ret))
+            if ret != 0:  # no data
+                return False
             self._rows_fetched = self._cursor.rows_fetched
-            return ret
+            return self._rows_fetched > 0
+        return True
+
+    def _decode_column(self, col, d, nrows):
+        """Decode the values of one column of the rowset."""
+        indicator = read_indicators(col, 0, nrows)
+        if col.target_type in CTYPE_FORMATS:
+            size = struct.calcsize(CTYPE_FORMATS[col.target_type])
+            data = ffi.buffer(col.data_array, size * nrows)
+            nulls = [ind == SQL_NULL_DATA for ind in indicator]
+            return decode_fixed(col.target_type, data, nulls)
+        # if d.type_code is Decimal:
+        #     raw = ffi.cast('SQL_NUMERIC_STRUCT*', col.data_array)
+        #     val = ffi.string(raw.val)
+        #     row.append(Decimal((raw.sign, (int(val, 16),), raw.scale)))
+        check_truncation(col, indicator)
+        dsize = varlen_stride(col)
+        raw = ffi.buffer(col.data_array, dsize * nrows)[:]
+        if col.target_type == SQL_C_BINARY:
+            return [None if ind == SQL_NULL_DATA else
+                    raw[i * dsize:i * dsize + ind]
+                    for i, ind in enumerate(indicator)]
+        if col.target_type == SQL_C_WCHAR:
+            encoding = 'utf-16-le'
+        else:
+            encoding = 'utf-8'
+        if d.type_code is str:
+            return [None if ind == SQL_NULL_DATA else
+                    raw[i * dsize:i * dsize + ind].decode(encoding)
+                    for i, ind in enumerate(indicator)]
+        return [None if ind == SQL_NULL_DATA else
+                d.type_code(raw[i * dsize:i * dsize + ind].decode(encoding))
+                for i, ind in enumerate(indicator)]
+
+    def _current_rowset(self):
+        """Return the rows of the rowset that was fetched last.
+
+        The bound buffers are decoded one column at a time, once per
+        rowset, and only when rows are actually requested.
+        """
+        if self._rowset is None:
+            nrows = self._rows_fetched
+            columns = []
+            col = self._cursor.firstcol
+            for d in self.description:
+                columns.append(self._decode_column(col, d, nrows))
+                col = col.next
+            self._rowset = list(zip(*columns))
+        return self._rowset
+
+    def _take(self, size):
+        """Take up to size rows from the current rowset."""
+        rowset = self._current_rowset()
+        end = min(self._rows_fetched, self._rowptr + size)
+        if self._rowptr == 0 and end == self._rows_fetched:
+            rows = rowset
+        else:
+            rows = rowset[self._rowptr:end]
+        self._rowptr = end
+        if end == self._rows_fetched:
+            self._rowset = None
+        return rows
 
     def fetchone(self):
         """Fetch a single result row from the cursor.
@@ -117,88 +387,118 @@ class Cursor(object):
         we deplete this buffer we reset the array pointer to 0 which
         will trigger a new call to SQLFetch when requesting a new row.
         """
-        if self._internal_fetch() == 1:  # no data
+        if not self._internal_fetch():
             return
-        row = []
-        col = self._cursor.firstcol
-        for d in self.description:
-            if col.indicator[self._rowptr] == -1:
-                row.append(None)
-                col = col.next
-                continue
-            if d.type_code is int:
-                raw = ffi.cast('SQLINTEGER*', col.data_array)
-                row.append(raw[self._rowptr])
-                col = col.next
-                continue
-            if d.type_code is float:
-                raw = ffi.cast('double*', col.data_array)
-                row.append(raw[self._rowptr])
-                col = col.next
-                continue
-            if d.type_code is datetime.date:
-                raw = ffi.cast('DATE_STRUCT*', col.data_array)
-                row.append(unmarshal_date(raw[self._rowptr]))
-                col = col.next
-                continue
-            if d.type_code is datetime.datetime:
-                raw = ffi.cast('TIMESTAMP_STRUCT*', col.data_array)
-                row.append(unmarshal_datetime(raw[self._rowptr]))
-                col = col.next
-                continue
-            # if d.type_code is Decimal:
-            #     raw = ffi.cast('SQL_NUMERIC_STRUCT*', col.data_array)
-            #     val = ffi.string(raw.val)
-            #     row.append(Decimal((raw.sign, (int(val, 16),), raw.scale)))
-            #     col = col.next
-            #     continue
-            if d.type_code is str and col.data_type < 0:  # unicode
-                dsize = d.display_size * 2
-                uc = True
-            else:
-                dsize = d.display_size + 1  # char[] with nul terminator
-                uc = False
-            total_size = dsize * self._arraysize
-            start = self._rowptr * dsize
-            end = start + col.indicator[self._rowptr]
-            raw = ffi.buffer(col.data_array, total_size)[start:end]
-            if uc:
-                val = raw.decode('utf-16-le')
-            else:
-                val = d.type_code(raw.decode('utf-8'))
-            row.append(val)
-            col = col.next
+        row = self._current_rowset()[self._rowptr]
         self._rowptr += 1
-        return tuple(row)
+        if self._rowptr == self._rows_fetched:
+            self._rowset = None
+        return row
+
+    def fetchshared(self):
+        """Fetch the rest of the current rowset into shared memory.
+
+        The rows are written in columnar form to a new
+        multiprocessing.shared_memory segment. The returned SharedRowset
+        can be sent to other processes, which attach to the segment by
+        name and read the columns without unpickling any rows.
+        Returns None when there are no more rows.
+
+        The caller owns the segment and should unlink() it once all
+        consumers are done with it.
+        """
+        if not self._internal_fetch():
+            return
+        start, stop = self._rowptr, self._rows_fetched
+        rowset = write_rowset(self._cursor.firstcol, self.description,
+                              start, stop)
+        self._rowptr = stop
+        self._rowset = None
+        return rowset
 
     def fetchmany(self, size=None):
         """Fetch many result rows from the cursor."""
         if size is None:
             size = self._arraysize
-        first = self.fetchone()
-        batchsize = min(self._rows_fetched, size)
-        return [first] + [self.fetchone() for i in range(batchsize - 1)]
+        rows = []
+        while len(rows) < size:
+            if not self._internal_fetch():
+                break
+            batch = self._take(size - len(rows))
+            if not batch:
+                break
+            if rows:
+                rows.extend(batch)
+            else:
+                rows = batch
+        return rows
 
     def fetchall(self):
         """Fetch all result rows from the cursor."""
         rows = []
-        result = self.fetchone()
-        while result:
-            rows.append(result)
-            result = self.fetchone()
+        for batch in self.iter_batches():
+            rows.extend(batch)
         return rows
 
+    def iter_batches(self, size=None):
+        """Yield lists of up to size rows until the results are exhausted.
+
+        size defaults to arraysize, in which case every batch is a whole
+        rowset. A rowset is released before the next one is fetched,
+        so memory use does not grow with the size of the result set.
+        """
+        while True:
+            rows = self.fetchmany(size)
+            if not rows:
+                return
+            yield rows
+
     def nextset(self):
         pass
 
     def prepare(self, stmt):
-        pass
+        """Prepare a statement for the next execute with parameters."""
+        self._check_pending()
+        self._prepare(stmt)
 
     def setinputsizes(self, sizes):
-        pass
+        """Declare the parameters of the next execute.
 
-    def setoutputsize(self, size):
-        pass
+        Each item is None to infer the type from the value, an int with
+        the maximum length of a string or bytes value, or a
+        (sql_type, size, decimal_digits) tuple. The declarations are
+        kept for every marker of the statement until another statement
+        is prepared.
+        """
+        self._inputsizes = list(sizes)
+
+    def setoutputsize(self, size, column=None):
+        """Set the largest value fetched from a long column.
+
+        Text and binary columns without a size, such as the (MAX) types,
+        or larger than size are bound with room for size characters or
+        bytes; longer values raise DataError when fetched. It applies to
+        statements executed afterwards, the default is 8000. Setting it
+        for a single column is not supported.
+        """
+        if column is not None:
+            raise NotSupportedError('Setting the output size of a single '
+                                    'column is not supported')
+        if not isinstance(size, int):
+            raise TypeError('Outputsize must be type int > 0')
+        if size <= 0:
+            raise ValueError('Outputsize must be > 0')
+        self._check_opened()
+        self._cursor.outputsize = size
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        row = self.fetchone()
+        if row is None:
+            raise StopIteration
+        return row
 
     def __del__(self):
         self.close()
@@ -40,11 +40,15 @@ typedef struct Cursor
   SQLHSTMT handle;
   cursor_state state;
   SQLULEN arraysize;
+  SQLULEN outputsize;
   SQLSMALLINT numcols;
+  SQLSMALLINT numparams;
   SQLCOLUMN *firstcol;
   SQLLEN rowcount;
   SQLULEN rows_fetched;
   SQLUSMALLINT *row_status;
+  int async_enabled;
+  int async_on;
 } SQLCURSOR;
 
 
@@ -186,6 +190,7 @@ free_results(SQLCURSOR *cursor)
     };
 
     dealloc_columns(cursor->firstcol);
+    cursor->firstcol = NULL;
 
     cursor->rowcount = -1;
     cursor->state = CLOSED;
@@ -198,7 +203,11 @@ SQLCURSOR * create_cursor(SQLHDBC hdbc) {
 
   cursor = (SQLCURSOR*)malloc(sizeof(SQLCURSOR));
   cursor->firstcol = NULL;
+  cursor->numparams = 0;
+  cursor->async_enabled = 0;
+  cursor->async_on = 0;
   cursor->arraysize = 1L;
+  cursor->outputsize = 8000L;
   cursor->rowcount = -1;
   cursor->state = CLOSED;
 
@@ -248,30 +257,46 @@ set_fetch_attributes(SQLCURSOR *cursor)
 // bind_column allocates memory for the driver to output
 // column data into
 static void
-bind_column(SQLHSTMT hstmt, SQLULEN arraysize, struct Column *col)
+bind_column(SQLHSTMT hstmt, SQLULEN arraysize, SQLULEN outputsize,
+            struct Column *col)
 {
   SQLSMALLINT target_type;
   SQLLEN alloc_size, padding;
+  SQLULEN size;
 
   padding = 0;
 
+  // (MAX) columns have no size and others can be up to 2GB,
+  // longer values than outputsize are truncated by the driver
+  size = col->size;
+  if (size == 0 || size > outputsize)
+    size = outputsize;
+
   switch (col->data_type) {
     case SQL_CHAR:
     case SQL_VARCHAR:
     case SQL_LONGVARCHAR:
       target_type = SQL_C_CHAR;
-      alloc_size = sizeof(SQLCHAR) * col->size + 1;  // NUL bit
+      alloc_size = sizeof(SQLCHAR) * size + 1;  // NUL bit
       break;
     case SQL_UNICODE_CHAR:
     case SQL_UNICODE_VARCHAR:
     case SQL_UNICODE_LONGVARCHAR:
       target_type = SQL_C_WCHAR;
-      alloc_size = sizeof(SQLWCHAR) * col->size;
+      alloc_size = sizeof(SQLWCHAR) * (size + 1);  // NUL character
+      break;
+    case SQL_BIT:
+      target_type = SQL_C_BIT;
+      alloc_size = sizeof(SQLCHAR);
+      break;
+    case SQL_TINYINT:
+      target_type = SQL_C_UTINYINT;
+      alloc_size = sizeof(SQLCHAR);
       break;
     case SQL_SMALLINT:
-      // target_type = SQL_C_SSHORT;
-      // alloc_size = sizeof(short int);
-      // break;
+      target_type = SQL_C_SSHORT;
+      alloc_size = sizeof(SQLSMALLINT);
+      break;
     case SQL_INTEGER:
       target_type = SQL_C_LONG;
       alloc_size = sizeof(SQLINTEGER);
@@ -281,8 +306,9 @@ bind_column(SQLHSTMT hstmt, SQLULEN arraysize, struct Column *col)
       alloc_size = sizeof(long long int);
       break;
     case SQL_REAL:
-      // target_type = SQL_C_FLOAT;
-      // alloc_size = sizeof(float);
+      target_type = SQL_C_FLOAT;
+      alloc_size = sizeof(SQLREAL);
+      break;
     case SQL_FLOAT:
     case SQL_DOUBLE:
       target_type = SQL_C_DOUBLE;
@@ -293,8 +319,9 @@ bind_column(SQLHSTMT hstmt, SQLULEN arraysize, struct Column *col)
       // target_type = SQL_C_NUMERIC;
       // alloc_size = sizeof(SQL_NUMERIC_STRUCT);
       target_type = SQL_C_CHAR;
-      alloc_size = sizeof(SQLCHAR) * col->size + 2;  // 1 extra for the dot
-      padding = 1;
+      size = col->size;
+      alloc_size = sizeof(SQLCHAR) * size + 3;  // sign, dot and NUL
+      padding = 2;
       break;
     case SQL_TYPE_DATE:
       target_type = SQL_C_TYPE_DATE;
@@ -305,13 +332,23 @@ bind_column(SQLHSTMT hstmt, SQLULEN arraysize, struct Column *col)
       target_type = SQL_C_TIMESTAMP;
       alloc_size = sizeof(TIMESTAMP_STRUCT);
       break;
+    case SQL_BINARY:
+    case SQL_VARBINARY:
+    case SQL_LONGVARBINARY:
+      target_type = SQL_C_BINARY;
+      alloc_size = sizeof(SQLCHAR) * size;
+      break;
+    case SQL_GUID:
+      target_type = SQL_C_GUID;
+      alloc_size = sizeof(SQLGUID);
+      break;
     default:
       target_type = SQL_C_CHAR;
-      alloc_size = sizeof(SQLCHAR) * col->size + 1;
+      alloc_size = sizeof(SQLCHAR) * size + 1;
   }
 
   // fprintf(stdout, "allocated %ld bytes\n", alloc_size * arraysize);
-  col->display_size = col->size + padding;
+  col->display_size = size + padding;
 
   col->target_type = target_type;
   col->data_array = (SQLPOINTER)malloc(alloc_size * arraysize);
@@ -353,7 +390,8 @@ check_execute_result(SQLCURSOR *cursor)
       fprintf(stderr, "Column name for column %d was truncated to %d characters",
              i, namebuf_size);
 
-    bind_column(cursor->handle, cursor->arraysize, thiscol);
+    bind_column(cursor->handle, cursor->arraysize, cursor->outputsize,
+                thiscol);
 
     /*printf("%d. name: %s, type: %d, length: %ld, nullable: %d\n", i,
            thiscol->name, thiscol->data_type, thiscol->size,
@@ -404,43 +442,246 @@ cursor_fetch(SQLCURSOR *cursor)
     return 100;
   }
 
-  if (!(cursor->firstcol)) {
-    fprintf(stderr, "No execution! Nothing to fetch!\n");
-    return 2;
-  }
+  // no result set, there is nothing to fetch
+  if (!(cursor->firstcol))
+    return 1;
 
   ret = SQLFetch(cursor->handle);
 
   if (ret == SQL_NO_DATA)
     return 1;
 
+  // errors, such as a cancelled statement or a timeout, are passed on
+  // so the buffers are not read; SQL_STILL_EXECUTING cannot be
+  // polled because fetches are never started asynchronously
+  if (ret == SQL_STILL_EXECUTING || !SQL_SUCCEEDED(ret))
+    return ret;
+
   cursor->state = OPENED;
   return 0;
 }
 
 
+// set_async switches asynchronous (polling) execution on or off
+static int
+set_async(SQLCURSOR *cursor, SQLULEN enable)
+{
+  int err;
+
+  err = try_odbc(SQLSetStmtAttr(cursor->handle, SQL_ATTR_ASYNC_ENABLE,
+                                (SQLPOINTER)enable, 0),
+                 "SQLSetStmtAttr", cursor->handle, SQL_HANDLE_STMT);
+  if (SQL_SUCCEEDED(err))
+    cursor->async_on = (enable == SQL_ASYNC_ENABLE_ON);
+
+  return err;
+}
+
+
+// finish_execute handles the return value of an (asynchronous) execute
+// SQL_STILL_EXECUTING is passed on so the caller can poll again later;
+// once done, async mode is switched off again so describing and fetching
+// the results does not have to be polled as well
+static int
+finish_execute(SQLCURSOR *cursor, SQLRETURN rc, char *f)
+{
+  int err;
+
+  if (rc == SQL_STILL_EXECUTING)
+    return rc;
+
+  err = try_odbc(rc, f, cursor->handle, SQL_HANDLE_STMT);
+  if (err != 0)
+    return err;
+
+  if (cursor->async_on)
+    set_async(cursor, SQL_ASYNC_ENABLE_OFF);
+
+  cursor->state = OPENED;
+  update_cursor_rowcount(cursor);
+
+  return check_execute_result(cursor);
+}
+
+
+// start_execute readies the cursor for a new result set
+static void
+start_execute(SQLCURSOR *cursor)
+{
+  free_results(cursor);
+
+  set_fetch_attributes(cursor);
+
+  if (cursor->async_enabled != cursor->async_on)
+    set_async(cursor, cursor->async_enabled ? SQL_ASYNC_ENABLE_ON
+                                            : SQL_ASYNC_ENABLE_OFF);
+}
+
+
 // cursor_execdirect executes a statement on a handle without preparation
 int
 cursor_execdirect(SQLCURSOR *cursor, SQLWCHAR *stmt, SQLLEN stmtlen)
+{
+  if (!cursor) {
+    fprintf(stderr, "Calling fetch on a closed cursor!\n");
+    return 100;
+  }
+
+  start_execute(cursor);
+
+  return finish_execute(cursor, SQLExecDirectW(cursor->handle, stmt, stmtlen),
+                        "SQLExecDirectW");
+}
+
+
+// cursor_execdirect_poll checks on an asynchronous cursor_execdirect,
+// it must be called with the same statement
+int
+cursor_execdirect_poll(SQLCURSOR *cursor, SQLWCHAR *stmt, SQLLEN stmtlen)
+{
+  if (!cursor) {
+    fprintf(stderr, "Calling poll on a closed cursor!\n");
+    return 100;
+  }
+
+  return finish_execute(cursor, SQLExecDirectW(cursor->handle, stmt, stmtlen),
+                        "SQLExecDirectW");
+}
+
+
+// cursor_prepare prepares a statement for repeated execution
+// and looks up the number of parameter markers in it
+int
+cursor_prepare(SQLCURSOR *cursor, SQLWCHAR *stmt, SQLLEN stmtlen)
 {
   int err;
 
   if (!cursor) {
-    fprintf(stderr, "Calling fetch on a closed cursor!\n");
+    fprintf(stderr, "Calling prepare on a closed cursor!\n");
     return 100;
   }
 
   free_results(cursor);
 
-  set_fetch_attributes(cursor);
+  // statements are prepared synchronously, even in async mode
+  if (cursor->async_on)
+    set_async(cursor, SQL_ASYNC_ENABLE_OFF);
 
-  err = try_odbc(SQLExecDirectW(cursor->handle, stmt, stmtlen), //strlen((char*)stmt)) / 2,
-                "SQLExecDirectW", cursor->handle, SQL_HANDLE_STMT);
+  try_odbc(SQLFreeStmt(cursor->handle, SQL_RESET_PARAMS),
+           "SQLFreeStmt", cursor->handle, SQL_HANDLE_STMT);
+
+  err = try_odbc(SQLPrepareW(cursor->handle, stmt, stmtlen),
+                 "SQLPrepareW", cursor->handle, SQL_HANDLE_STMT);
   if (err != 0)
     return err;
 
-  cursor->state = OPENED;
-  update_cursor_rowcount(cursor);
+  return try_odbc(SQLNumParams(cursor->handle, &cursor->numparams),
+                  "SQLNumParams", cursor->handle, SQL_HANDLE_STMT);
+}
 
-  return check_execute_result(cursor);
+
+// bind_parameter binds a buffer owned by the caller to a parameter
+// marker; the buffer must stay alive until it is bound again
+int
+bind_parameter(SQLCURSOR *cursor, SQLUSMALLINT index, SQLSMALLINT c_type,
+               SQLSMALLINT sql_type, SQLULEN size, SQLSMALLINT decimal_digits,
+               SQLPOINTER value, SQLLEN buffer_length, SQLLEN *indicator)
+{
+  return try_odbc(SQLBindParameter(cursor->handle, index, SQL_PARAM_INPUT,
+                                   c_type, sql_type, size, decimal_digits,
+                                   value, buffer_length, indicator),
+                  "SQLBindParameter", cursor->handle, SQL_HANDLE_STMT);
+}
+
+
+// describe_parameter asks the driver for the SQL type of a parameter marker
+// not every driver can, so failing is not an error and nothing is printed
+int
+describe_parameter(SQLCURSOR *cursor, SQLUSMALLINT index, SQLSMALLINT *sql_type,
+                   SQLULEN *size, SQLSMALLINT *decimal_digits)
+{
+  SQLSMALLINT nullable;
+
+  if (!cursor) {
+    fprintf(stderr, "Calling describe on a closed cursor!\n");
+    return 100;
+  }
+
+  return SQLDescribeParam(cursor->handle, index, sql_type, size,
+                          decimal_digits, &nullable);
+}
+
+
+// cursor_execute executes a prepared statement with the bound parameters
+int
+cursor_execute(SQLCURSOR *cursor)
+{
+  if (!cursor) {
+    fprintf(stderr, "Calling execute on a closed cursor!\n");
+    return 100;
+  }
+
+  start_execute(cursor);
+
+  return finish_execute(cursor, SQLExecute(cursor->handle), "SQLExecute");
+}
+
+
+// cursor_execute_poll checks on an asynchronous cursor_execute
+int
+cursor_execute_poll(SQLCURSOR *cursor)
+{
+  if (!cursor) {
+    fprintf(stderr, "Calling poll on a closed cursor!\n");
+    return 100;
+  }
+
+  return finish_execute(cursor, SQLExecute(cursor->handle), "SQLExecute");
+}
+
+
+// cursor_set_async enables or disables asynchronous execution
+// it is applied when the next statement is executed, so an open
+// result set keeps being fetched synchronously
+int
+cursor_set_async(SQLCURSOR *cursor, int enabled)
+{
+  if (!cursor) {
+    fprintf(stderr, "Calling set_async on a closed cursor!\n");
+    return 100;
+  }
+
+  cursor->async_enabled = enabled;
+  return 0;
+}
+
+
+// cursor_set_timeout sets the number of seconds to wait for a statement
+// to execute before cancelling it, 0 means no timeout
+int
+cursor_set_timeout(SQLCURSOR *cursor, SQLULEN timeout)
+{
+  if (!cursor) {
+    fprintf(stderr, "Calling set_timeout on a closed cursor!\n");
+    return 100;
+  }
+
+  return try_odbc(SQLSetStmtAttr(cursor->handle, SQL_ATTR_QUERY_TIMEOUT,
+                                 (SQLPOINTER)timeout, 0),
+                  "SQLSetStmtAttr", cursor->handle, SQL_HANDLE_STMT);
+}
+
+
+// cursor_cancel cancels the statement executing on the cursor,
+// it may be called from another thread
+int
+cursor_cancel(SQLCURSOR *cursor)
+{
+  if (!cursor) {
+    fprintf(stderr, "Calling cancel on a closed cursor!\n");
+    return 100;
+  }
+
+  return try_odbc(SQLCancel(cursor->handle),
+                  "SQLCancel", cursor->handle, SQL_HANDLE_STMT);
 }
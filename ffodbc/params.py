@@ -0,0 +1,217 @@
+"""Binding of statement parameters.
+
+Every parameter marker of a prepared statement gets a buffer that
+stays bound for as long as the statement is re-executed. New values
+are copied into the existing buffer; SQLBindParameter is only called
+again when the C type changes or a value does not fit anymore.
+"""
+import datetime
+import struct
+from collections import namedtuple
+from decimal import Decimal
+
+from ffodbc._ffodbc import lib, ffi
+from ffodbc.exceptions import DataError, NotSupportedError
+from ffodbc.sqltypes import (SQL_C_CHAR, SQL_C_WCHAR, SQL_C_BINARY,
+                             SQL_C_BIT, SQL_C_SBIGINT, SQL_C_DOUBLE,
+                             SQL_C_TYPE_DATE, SQL_C_TYPE_TIMESTAMP,
+                             SQL_C_DEFAULT, SQL_BIT, SQL_BIGINT,
+                             SQL_VARBINARY, SQL_LONGVARBINARY, SQL_WVARCHAR,
+                             SQL_WLONGVARCHAR, SQL_VARCHAR, SQL_LONGVARCHAR,
+                             SQL_NUMERIC, SQL_DOUBLE, SQL_TYPE_DATE,
+                             SQL_TYPE_TIMESTAMP, SQL_NULL_DATA)
+
+
+ParamDescription = namedtuple('ParamDescription', [
+    'sql_type', 'size', 'decimal_digits'
+])
+
+# variable length types and the largest size they can be sent with,
+# longer values are sent as the long type (the (MAX) types in MSSQL)
+LONG_TYPES = {
+    SQL_VARCHAR: (8000, SQL_LONGVARCHAR),
+    SQL_WVARCHAR: (4000, SQL_WLONGVARCHAR),
+    SQL_VARBINARY: (8000, SQL_LONGVARBINARY),
+}
+
+
+def fit(description):
+    """Return the description with a long type if the size needs one."""
+    try:
+        limit, long_type = LONG_TYPES[description.sql_type]
+    except KeyError:
+        return description
+    if description.size > limit:
+        return description._replace(sql_type=long_type)
+    return description
+
+
+def _encode_bool(value):
+    return SQL_C_BIT, ParamDescription(SQL_BIT, 1, 0), \
+        b'\x01' if value else b'\x00'
+
+
+def _encode_int(value):
+    try:
+        data = struct.pack('q', value)
+    except struct.error:
+        raise DataError('Integer parameter {} does not fit in 64 bits'
+                        .format(value))
+    return SQL_C_SBIGINT, ParamDescription(SQL_BIGINT, 19, 0), data
+
+
+def _encode_float(value):
+    return SQL_C_DOUBLE, ParamDescription(SQL_DOUBLE, 15, 0), \
+        struct.pack('d', value)
+
+
+def _encode_decimal(value):
+    if not value.is_finite():
+        raise DataError('Decimal parameter {} is not a finite number'
+                        .format(value))
+    sign, digits, exponent = value.as_tuple()
+    scale = max(0, -exponent)
+    precision = max(len(digits) + max(0, exponent), scale)
+    return SQL_C_CHAR, ParamDescription(SQL_NUMERIC, precision, scale), \
+        '{:f}'.format(value).encode('ascii')
+
+
+def _encode_str(value):
+    data = value.encode('utf-16-le')
+    size = max(len(data) // 2, 1)
+    return SQL_C_WCHAR, fit(ParamDescription(SQL_WVARCHAR, size, 0)), data
+
+
+def _encode_bytes(value):
+    size = max(len(value), 1)
+    return SQL_C_BINARY, fit(ParamDescription(SQL_VARBINARY, size, 0)), \
+        bytes(value)
+
+
+def _encode_date(value):
+    return SQL_C_TYPE_DATE, ParamDescription(SQL_TYPE_DATE, 10, 0), \
+        struct.pack('hHH', value.year, value.month, value.day)
+
+
+def _encode_datetime(value):
+    return SQL_C_TYPE_TIMESTAMP, ParamDescription(SQL_TYPE_TIMESTAMP, 27, 7), \
+        struct.pack('hHHHHHI', value.year, value.month, value.day,
+                    value.hour, value.minute, value.second,
+                    value.microsecond * 1000)
+
+
+def _encode_none(value):
+    return SQL_C_DEFAULT, ParamDescription(SQL_VARCHAR, 1, 0), None
+
+
+ENCODERS = {
+    bool: _encode_bool,
+    int: _encode_int,
+    float: _encode_float,
+    Decimal: _encode_decimal,
+    str: _encode_str,
+    bytes: _encode_bytes,
+    bytearray: _encode_bytes,
+    datetime.date: _encode_date,
+    datetime.datetime: _encode_datetime,
+    type(None): _encode_none,
+}
+
+
+def encode(value):
+    """Return the C type, description and raw data for a Python value."""
+    try:
+        encoder = ENCODERS[type(value)]
+    except KeyError:
+        raise NotSupportedError('Parameters of type {} are not supported'
+                                .format(type(value).__name__))
+    return encoder(value)
+
+
+def grow(description, other):
+    """Return a description large enough for both descriptions.
+
+    The SQL type of the first description is kept, so declared types win,
+    unless the size only fits in its long type.
+    """
+    digits = max(description.decimal_digits, other.decimal_digits)
+    size = max(description.size - description.decimal_digits,
+               other.size - other.decimal_digits) + digits
+    return fit(ParamDescription(description.sql_type, size, digits))
+
+
+def buffer_length(c_type, description):
+    """Number of bytes needed to hold a value of this description."""
+    if c_type == SQL_C_WCHAR:
+        return description.size * 2
+    if c_type == SQL_C_CHAR:
+        return description.size + 2  # sign and decimal point
+    if c_type == SQL_C_BINARY:
+        return description.size
+    return 0
+
+
+class Statement(object):
+    """The parameters bound for a statement, kept while it is cached."""
+
+    def __init__(self, numparams):
+        self.params = [None] * numparams
+        self.declared = [None] * numparams
+
+
+class Parameter(object):
+    """A buffer bound to a single parameter marker."""
+
+    def __init__(self, c_type, description, length):
+        self.c_type = c_type
+        self.description = description
+        self.buffer_length = max(length, buffer_length(c_type, description))
+        self.buffer = ffi.new('char[]', max(self.buffer_length, 1))
+        self.indicator = ffi.new('SQLLEN*', SQL_NULL_DATA)
+
+    def bind(self, cursor, index):
+        return lib.bind_parameter(cursor, index, self.c_type,
+                                  self.description.sql_type,
+                                  self.description.size,
+                                  self.description.decimal_digits,
+                                  self.buffer, self.buffer_length,
+                                  self.indicator)
+
+    def write(self, data):
+        if data is None:
+            self.indicator[0] = SQL_NULL_DATA
+        else:
+            ffi.memmove(self.buffer, data, len(data))
+            self.indicator[0] = len(data)
+
+
+def prepare_parameter(param, value, inputsize=None):
+    """Return the parameter to bind for value, or None to keep param.
+
+    inputsize is an item passed to Cursor.setinputsizes: None, a maximum
+    length, or a (sql_type, size, decimal_digits) description. It is
+    applied whenever a new parameter has to be bound.
+    """
+    c_type, description, data = encode(value)
+
+    if data is None and param is not None:
+        # NULL keeps the type that is already bound
+        param.write(data)
+        return
+
+    if param is not None and param.c_type == c_type:
+        description = grow(param.description, description)
+        if description == param.description and \
+                len(data) <= param.buffer_length:
+            param.write(data)
+            return
+    elif isinstance(inputsize, int):
+        size = max(description.size, inputsize)
+        description = fit(description._replace(size=size))
+    elif inputsize is not None:
+        description = grow(ParamDescription(*inputsize), description)
+
+    length = 0 if data is None else len(data)
+    param = Parameter(c_type, description, length)
+    param.write(data)
+    return param
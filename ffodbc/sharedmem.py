@@ -0,0 +1,236 @@
+"""Columnar result sets in shared memory.
+
+A rowset is written into a single multiprocessing.shared_memory segment
+so other processes can read it without copying or unpickling rows.
+The segment starts with the length of a JSON header, followed by the
+header itself and an 8-byte aligned section per column:
+
+- a null bitmap, one bit per row, set when the value is NULL;
+- for fixed-width columns the raw values as bound by the driver;
+- for text and binary columns int64 offsets (rows + 1) followed by
+  the raw data.
+"""
+import json
+import struct
+import sys
+from multiprocessing import resource_tracker, shared_memory
+
+from ffodbc._ffodbc import ffi
+from ffodbc.sqltypes import TYPEMAP, CTYPE_FORMATS, SQL_C_CHAR, SQL_C_WCHAR
+from ffodbc.tools import (decode_fixed, read_indicators, varlen_stride,
+                          check_truncation)
+
+
+TEXT_ENCODINGS = {
+    SQL_C_CHAR: 'utf-8',
+    SQL_C_WCHAR: 'utf-16-le',
+}
+
+TYPES = {t.__name__: t for t in set(TYPEMAP.values())}
+
+_HEADER_LEN = struct.Struct('Q')
+
+# names of the segments created by this process, which stay registered
+# with the resource tracker so they are removed if the process dies
+_created = set()
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def _null_bitmap(indicator):
+    bitmap = bytearray((len(indicator) + 7) // 8)
+    for i, ind in enumerate(indicator):
+        if ind == -1:
+            bitmap[i >> 3] |= 1 << (i & 7)
+    return bitmap
+
+
+def write_rowset(firstcol, description, start, stop):
+    """Copy rows start to stop of the bound columns into shared memory."""
+    nrows = stop - start
+    sections = []
+    columns = []
+    offset = 0
+
+    col = firstcol
+    for d in description:
+        indicator = read_indicators(col, start, stop)
+        info = {
+            'description': [d.name, d.type_code.__name__, d.display_size,
+                            d.internal_size, d.precision, d.scale, d.null_ok],
+            'ctype': col.target_type,
+        }
+
+        bitmap = _null_bitmap(indicator)
+        info['nulls'] = offset
+        sections.append((offset, bitmap))
+        offset = _align(offset + len(bitmap))
+
+        fmt = CTYPE_FORMATS.get(col.target_type)
+        if fmt is not None:
+            itemsize = struct.calcsize(fmt)
+            data = ffi.cast('char*', col.data_array) + start * itemsize
+            data = ffi.buffer(data, nrows * itemsize)
+            info['format'] = fmt
+            info['values'] = offset
+            sections.append((offset, data))
+            offset = _align(offset + len(data))
+        else:
+            check_truncation(col, indicator)
+            stride = varlen_stride(col)
+            raw = ffi.buffer(col.data_array, stride * stop)
+            offsets = [0]
+            chunks = []
+            for i, ind in enumerate(indicator, start):
+                if ind > 0:
+                    chunks.append(raw[i * stride:i * stride + ind])
+                    offsets.append(offsets[-1] + ind)
+                else:
+                    offsets.append(offsets[-1])
+            offsets = struct.pack('{}q'.format(nrows + 1), *offsets)
+            data = b''.join(chunks)
+            info['encoding'] = TEXT_ENCODINGS.get(col.target_type)
+            info['offsets'] = offset
+            sections.append((offset, offsets))
+            offset = _align(offset + len(offsets))
+            info['values'] = offset
+            sections.append((offset, data))
+            offset = _align(offset + len(data))
+
+        columns.append(info)
+        col = col.next
+
+    header = json.dumps({'rows': nrows, 'columns': columns}).encode('utf-8')
+    base = _align(_HEADER_LEN.size + len(header))
+
+    shm = shared_memory.SharedMemory(create=True, size=base + max(offset, 1))
+    _created.add(shm.name)
+    _HEADER_LEN.pack_into(shm.buf, 0, len(header))
+    shm.buf[_HEADER_LEN.size:_HEADER_LEN.size + len(header)] = header
+    for pos, data in sections:
+        shm.buf[base + pos:base + pos + len(data)] = data
+    return SharedRowset(shm)
+
+
+class SharedRowset(object):
+    """A columnar rowset stored in a shared memory segment.
+
+    Pickling a SharedRowset only sends the name of the segment;
+    the receiving process attaches to the same memory.
+    """
+
+    def __init__(self, shm):
+        self._shm = shm
+        buf = shm.buf
+        (header_len,) = _HEADER_LEN.unpack_from(buf, 0)
+        header = buf[_HEADER_LEN.size:_HEADER_LEN.size + header_len]
+        header = json.loads(bytes(header).decode('utf-8'))
+        self._base = _align(_HEADER_LEN.size + header_len)
+        self._rows = header['rows']
+        self._columns = header['columns']
+        self.description = []
+        for info in self._columns:
+            d = list(info['description'])
+            d[1] = TYPES.get(d[1], str)
+            self.description.append(tuple(d))
+
+    @classmethod
+    def attach(cls, name):
+        """Attach to an existing shared memory segment by name.
+
+        The segment is not registered with this process's resource
+        tracker, which would otherwise destroy it when the process exits
+        while the creator or other readers still use it.
+        """
+        if sys.version_info >= (3, 13):
+            return cls(shared_memory.SharedMemory(name=name, track=False))
+        shm = shared_memory.SharedMemory(name=name)
+        if shm.name not in _created and sys.platform != 'win32':
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return cls(shm)
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def __len__(self):
+        return self._rows
+
+    def nulls(self, index):
+        """Return a list of booleans, True where the value is NULL."""
+        info = self._columns[index]
+        start = self._base + info['nulls']
+        bitmap = self._shm.buf[start:start + (self._rows + 7) // 8]
+        return [bool(bitmap[i >> 3] & (1 << (i & 7)))
+                for i in range(self._rows)]
+
+    def values(self, index):
+        """Return a zero-copy memoryview of a fixed-width column.
+
+        Values in NULL rows are undefined.
+        """
+        info = self._columns[index]
+        fmt = info.get('format')
+        if fmt is None or len(fmt) > 1:
+            raise TypeError('Column {} is not a scalar fixed-width column'
+                            .format(index))
+        start = self._base + info['values']
+        end = start + self._rows * struct.calcsize(fmt)
+        return self._shm.buf[start:end].cast(fmt)
+
+    def column(self, index):
+        """Decode a single column to a list of Python values."""
+        info = self._columns[index]
+        buf = self._shm.buf
+        start = self._base + info['values']
+        type_code = self.description[index][1]
+        nulls = self.nulls(index)
+
+        fmt = info.get('format')
+        if fmt is not None:
+            end = start + self._rows * struct.calcsize(fmt)
+            return decode_fixed(info['ctype'], buf[start:end], nulls)
+
+        pos = self._base + info['offsets']
+        offsets = buf[pos:pos + (self._rows + 1) * 8].cast('q').tolist()
+        data = bytes(buf[start:start + offsets[-1]])
+        encoding = info['encoding']
+        if encoding is None:
+            return [None if null else data[offsets[i]:offsets[i + 1]]
+                    for i, null in enumerate(nulls)]
+        if type_code is str:
+            return [None if null else
+                    data[offsets[i]:offsets[i + 1]].decode(encoding)
+                    for i, null in enumerate(nulls)]
+        return [None if null else
+                type_code(data[offsets[i]:offsets[i + 1]].decode(encoding))
+                for i, null in enumerate(nulls)]
+
+    def rows(self):
+        """Decode the rowset to a list of tuples."""
+        return list(zip(*(self.column(i)
+                          for i in range(len(self._columns)))))
+
+    def close(self):
+        """Detach from the shared memory segment."""
+        self._shm.close()
+
+    def unlink(self):
+        """Destroy the shared memory segment, call once per rowset."""
+        if self.name in _created:
+            _created.discard(self.name)
+        elif sys.version_info < (3, 13) and sys.platform != 'win32':
+            # unlink unregisters the segment, so register it for balance
+            resource_tracker.register(self._shm._name, 'shared_memory')
+        self._shm.unlink()
+
+    def __reduce__(self):
+        return (SharedRowset.attach, (self.name,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args, **kwargs):
+        self.close()
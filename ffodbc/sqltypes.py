@@ -1,17 +1,25 @@
 import datetime
+import uuid
 from decimal import Decimal
 
 
 TYPEMAP = {
+    (-11): uuid.UUID,  # SQL_GUID
+    (-10): str,  # SQL_WLONGVARCHAR
     (-9): str,  # SQL_UNICODE_VARCHAR / SQL_WVARCHAR
     (-8): str,  # SQL_UNICODE_CHAR / SQL_WCHAR
     (-7): bool,  # SQL_BIT
     (-6): int,  # SQL_TINYINT
     (-5): int,  # SQL_BIGINT
+    (-4): bytes,  # SQL_LONGVARBINARY
+    (-3): bytes,  # SQL_VARBINARY
+    (-2): bytes,  # SQL_BINARY
+    (-1): str,  # SQL_LONGVARCHAR
     1: str,  # SQL_CHAR
     2: Decimal,  # SQL_NUMERIC
     3: Decimal,  # SQL_DECIMAL
     4: int,  # SQL_INTEGER
+    5: int,  # SQL_SMALLINT
     6: float,  # SQL_FLOAT
     7: float,  # SQL_REAL
     8: float,  # SQL_DOUBLE
@@ -20,3 +28,53 @@ TYPEMAP = {
     91: datetime.date,  # SQL_TYPE_DATE
     93: datetime.datetime,  # SQL_TYPE_TIMESTAMP
 }
+
+
+# C data types the columns are bound to, see bind_column in ffodbc.c
+SQL_C_CHAR = 1
+SQL_C_WCHAR = -8
+SQL_C_BIT = -7
+SQL_C_UTINYINT = -28
+SQL_C_SSHORT = -15
+SQL_C_LONG = 4
+SQL_C_SBIGINT = -25
+SQL_C_FLOAT = 7
+SQL_C_DOUBLE = 8
+SQL_C_TYPE_DATE = 91
+SQL_C_TIMESTAMP = 11
+SQL_C_GUID = -11
+SQL_C_BINARY = -2
+SQL_C_TYPE_TIMESTAMP = 93
+SQL_C_DEFAULT = 99
+
+# struct formats of the fixed-width C types, matching the structs in ffodbc.c
+CTYPE_FORMATS = {
+    SQL_C_BIT: 'B',
+    SQL_C_UTINYINT: 'B',
+    SQL_C_SSHORT: 'h',
+    SQL_C_LONG: 'i',
+    SQL_C_SBIGINT: 'q',
+    SQL_C_FLOAT: 'f',
+    SQL_C_DOUBLE: 'd',
+    SQL_C_TYPE_DATE: 'hHH',
+    SQL_C_TIMESTAMP: 'hHHHHHI',
+    SQL_C_GUID: '16s',
+}
+
+# SQL data types parameters are sent as
+SQL_BIT = -7
+SQL_BIGINT = -5
+SQL_LONGVARBINARY = -4
+SQL_VARBINARY = -3
+SQL_LONGVARCHAR = -1
+SQL_WLONGVARCHAR = -10
+SQL_WVARCHAR = -9
+SQL_NUMERIC = 2
+SQL_DOUBLE = 8
+SQL_VARCHAR = 12
+SQL_TYPE_DATE = 91
+SQL_TYPE_TIMESTAMP = 93
+
+SQL_NULL_DATA = -1
+SQL_NO_TOTAL = -4
+SQL_STILL_EXECUTING = 2
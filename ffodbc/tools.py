@@ -1,7 +1,13 @@
 import datetime
+import struct
+import uuid
 
 from ffodbc._ffodbc import ffi, lib
-from ffodbc.exceptions import ProgrammingError, DataError, DatabaseError
+from ffodbc.exceptions import (ProgrammingError, DataError, DatabaseError,
+                               OperationalError)
+from ffodbc.sqltypes import (CTYPE_FORMATS, SQL_C_WCHAR, SQL_C_BINARY,
+                             SQL_C_BIT, SQL_C_TYPE_DATE, SQL_C_TIMESTAMP,
+                             SQL_C_GUID, SQL_NO_TOTAL)
 
 
 def unmarshal_datetime(val):
@@ -16,6 +22,70 @@ def unmarshal_date(val):
     return datetime.date(val.year, val.month, val.day)
 
 
+def varlen_stride(col):
+    """Number of bytes per row in the data array of a text or binary column."""
+    if col.target_type == SQL_C_WCHAR:
+        return (col.display_size + 1) * 2  # SQLWCHAR[] with nul terminator
+    if col.target_type == SQL_C_BINARY:
+        return col.display_size
+    return col.display_size + 1  # char[] with nul terminator
+
+
+def check_truncation(col, indicator):
+    """Raise DataError if a value did not fit in the bound buffer."""
+    capacity = varlen_stride(col)
+    if col.target_type == SQL_C_WCHAR:
+        capacity -= 2
+    elif col.target_type != SQL_C_BINARY:
+        capacity -= 1
+    for ind in indicator:
+        if ind > capacity or ind == SQL_NO_TOTAL:
+            raise DataError('A value does not fit in the {} bytes bound for '
+                            'the column, increase Cursor.setoutputsize'
+                            .format(capacity))
+
+
+def read_indicators(col, start, stop):
+    """Return a memoryview of the length/indicator values of a column."""
+    size = (stop - start) * ffi.sizeof('SQLLEN')
+    return memoryview(ffi.buffer(col.indicator + start, size)).cast('l')
+
+
+def _to_date(v):
+    return datetime.date(*v)
+
+
+def _to_datetime(v):
+    return datetime.datetime(v[0], v[1], v[2], v[3], v[4], v[5], v[6] // 1000)
+
+
+def _to_uuid(v):
+    return uuid.UUID(bytes_le=v[0])
+
+
+STRUCT_CONVERTERS = {
+    SQL_C_TYPE_DATE: _to_date,
+    SQL_C_TIMESTAMP: _to_datetime,
+    SQL_C_GUID: _to_uuid,
+}
+
+
+def decode_fixed(ctype, data, nulls):
+    """Decode a buffer of fixed-width C values to a list of Python values.
+
+    nulls holds a boolean per row, the values of NULL rows are not read.
+    """
+    fmt = CTYPE_FORMATS[ctype]
+    if ctype in STRUCT_CONVERTERS:
+        convert = STRUCT_CONVERTERS[ctype]
+        return [None if null else convert(v)
+                for v, null in zip(struct.iter_unpack(fmt, data), nulls)]
+    values = memoryview(data).cast(fmt).tolist()
+    if ctype == SQL_C_BIT:
+        return [None if null else bool(v) for v, null in zip(values, nulls)]
+    return [None if null else v for v, null in zip(values, nulls)]
+
+
 def _raise_error(error):
     state = ffi.string(error.state).decode('utf-8')
     status_code = state[:2]
@@ -25,6 +95,8 @@ def _raise_error(error):
     lib.free_error(error)
     error = ffi.NULL
 
+    if state in ('HY008', 'HYT00'):  # cancelled or timed out
+        raise OperationalError(message)
     if status_code == '42':
         raise ProgrammingError(message)
     if status_code == '22':
@@ -4,7 +4,12 @@ These tests require a MSSQL database running on localhost
 
 from datetime import date, datetime
 from decimal import Decimal
+import multiprocessing
+import pickle
 import sys
+import threading
+import time
+import uuid
 
 import pytest
 
@@ -285,3 +290,270 @@ def test_cursor_overalloc(cursor):
     assert len(rows) == 10
     assert rows[0][0] == 'Hallo, 0!'
     assert rows[-1][0] == 'Hallo, 9!'
+
+
+def test_cursor_fetchshared(cursor):
+    """Rowsets written to shared memory decode to the same rows."""
+    cursor.arraysize = 8
+    cursor.execute("SELECT TOP 10 value, date, CAST(NULL AS INT) AS n FROM test;")
+    rowset = cursor.fetchshared()
+    try:
+        attached = pickle.loads(pickle.dumps(rowset))
+        assert len(attached) == 8
+        assert attached.description[0][:2] == ('value', str)
+        rows = attached.rows()
+        assert rows[0] == ('Hallo, 0!', date(2016, 1, 28), None)
+        assert rows[-1][0] == 'Hallo, 7!'
+        attached.close()
+    finally:
+        rowset.close()
+        rowset.unlink()
+    rowset = cursor.fetchshared()
+    assert len(rowset) == 2
+    rowset.close()
+    rowset.unlink()
+    assert cursor.fetchshared() is None
+
+
+def _count_rows(rowset):
+    return len(rowset.rows())
+
+
+def test_cursor_fetchshared_other_process(cursor):
+    """A process reading a rowset does not destroy it when it exits."""
+    cursor.execute("SELECT TOP 4 value FROM test;")
+    rowset = cursor.fetchshared()
+    try:
+        for _ in range(2):
+            with multiprocessing.get_context('spawn').Pool(1) as pool:
+                assert pool.apply(_count_rows, (rowset,)) == 4
+        assert rowset.rows()[0] == ('Hallo, 0!',)
+    finally:
+        rowset.close()
+        rowset.unlink()
+
+
+def test_execute_parameters(cursor):
+    """Parameters of various types are bound and sent correctly."""
+    cursor.execute("SELECT ?, ?, ?, ?, ?;",
+                   (42, 'Hallo Ⓓ!', Decimal('3.14'), date(2016, 1, 28), None))
+    result = cursor.fetchone()
+    assert result == (42, 'Hallo Ⓓ!', Decimal('3.14'), date(2016, 1, 28), None)
+
+
+def test_execute_parameters_rebind(cursor):
+    """Re-executing a statement only rebinds when a value outgrows its buffer."""
+    cursor.execute("INSERT INTO test (value) VALUES (?);", ('a',))
+    param = cursor._params[0]
+    cursor.execute("INSERT INTO test (value) VALUES (?);", ('b',))
+    assert cursor._params[0] is param
+    cursor.execute("INSERT INTO test (value) VALUES (?);", ('a longer value',))
+    assert cursor._params[0] is not param
+    cursor.execute("SELECT COUNT(*) FROM test WHERE value = ?;", ('a longer value',))
+    assert cursor.fetchone()[0] == 1
+
+
+def test_setinputsizes(cursor):
+    """Declared input sizes are kept for later executes."""
+    cursor.setinputsizes([20])
+    cursor.execute("INSERT INTO test (value) VALUES (?);", ('a',))
+    param = cursor._params[0]
+    assert param.description.size == 20
+    cursor.execute("INSERT INTO test (value) VALUES (?);", ('a longer value',))
+    assert cursor._params[0] is param
+
+
+def test_cursor_fetch_native_types(cursor):
+    """Test BIT, TINYINT, SMALLINT, BIGINT, REAL, VARBINARY and GUID handling."""
+    cursor.execute("""
+        SELECT
+            CAST(1 AS BIT) AS col1,
+            CAST(255 AS TINYINT) AS col2,
+            CAST(-32768 AS SMALLINT) AS col3,
+            CAST(9223372036854775807 AS BIGINT) AS col4,
+            CAST(0.5 AS REAL) AS col5,
+            CAST(0xDEADBEEF AS VARBINARY(8)) AS col6,
+            CAST('6F9619FF-8B86-D011-B42D-00C04FC964FF' AS UNIQUEIDENTIFIER) AS col7;
+    """)
+    result = cursor.fetchone()
+    assert result == (True, 255, -32768, 9223372036854775807, 0.5,
+                      b'\xde\xad\xbe\xef',
+                      uuid.UUID('6F9619FF-8B86-D011-B42D-00C04FC964FF'))
+
+
+def test_cursor_fetch_max_columns(cursor):
+    """(MAX) columns are fetched up to the output size."""
+    cursor.execute("SELECT CAST(0xDEADBEEF AS VARBINARY(MAX)) AS b, "
+                   "CAST(N'abc' AS NVARCHAR(MAX)) AS t;")
+    assert cursor.fetchone() == (b'\xde\xad\xbe\xef', 'abc')
+
+
+def test_cursor_setoutputsize(cursor):
+    """Values longer than the output size raise instead of being cut."""
+    cursor.setoutputsize(4)
+    cursor.execute("SELECT CAST(0xDEADBEEF AS VARBINARY(MAX));")
+    assert cursor.fetchone() == (b'\xde\xad\xbe\xef',)
+    cursor.execute("SELECT CAST(0xDEADBEEF00 AS VARBINARY(MAX));")
+    with pytest.raises(ffodbc.exceptions.DataError):
+        cursor.fetchone()
+    cursor.execute("SELECT CAST(N'abcde' AS NVARCHAR(MAX));")
+    with pytest.raises(ffodbc.exceptions.DataError):
+        cursor.fetchone()
+
+
+def test_cursor_asynchronous(cursor):
+    """Asynchronous execute returns immediately and finishes on poll."""
+    cursor.asynchronous = True
+    cursor.execute("WAITFOR DELAY '00:00:01'; SELECT 42 AS v;")
+    with pytest.raises(ffodbc.exceptions.ProgrammingError):
+        cursor.fetchone()
+    while not cursor.poll():
+        time.sleep(0.01)
+    assert cursor.fetchone() == (42,)
+
+
+def test_cursor_cancel(cursor):
+    """A cancelled asynchronous statement raises OperationalError."""
+    cursor.asynchronous = True
+    cursor.execute("WAITFOR DELAY '00:00:10';")
+    cursor.cancel()
+    with pytest.raises(ffodbc.exceptions.OperationalError):
+        while not cursor.poll():
+            time.sleep(0.01)
+
+
+def test_cursor_timeout(cursor):
+    """A statement running longer than the timeout raises OperationalError."""
+    cursor.timeout = 1
+    with pytest.raises(ffodbc.exceptions.OperationalError):
+        cursor.execute("WAITFOR DELAY '00:00:05';")
+
+
+def test_cursor_cancel_during_fetch(cursor):
+    """Cancelling while rows are fetched raises instead of ending quietly."""
+    cursor.execute("SELECT a.name FROM sys.all_objects a "
+                   "CROSS JOIN sys.all_objects b "
+                   "CROSS JOIN sys.all_objects c;")
+    timer = threading.Timer(0.5, cursor.cancel)
+    timer.start()
+    try:
+        with pytest.raises(ffodbc.exceptions.DatabaseError):
+            for row in cursor:
+                pass
+    finally:
+        timer.cancel()
+
+
+def test_cursor_asynchronous_open_results(cursor):
+    """Enabling asynchronous mode does not affect the open result set."""
+    cursor.execute("SELECT TOP 20 value FROM test;")
+    cursor.fetchone()
+    cursor.asynchronous = True
+    assert len(cursor.fetchall()) == 19
+
+
+def test_cursor_iter(cursor):
+    """Iterating a cursor streams all rows across rowsets."""
+    cursor.arraysize = 8
+    cursor.execute("SELECT TOP 20 value FROM test;")
+    rows = list(cursor)
+    assert len(rows) == 20
+    assert rows[0][0] == 'Hallo, 0!'
+    assert rows[-1][0] == 'Hallo, 19!'
+
+
+def test_cursor_iter_batches(cursor):
+    """iter_batches yields whole rowsets until the results are exhausted."""
+    cursor.arraysize = 8
+    cursor.execute("SELECT TOP 20 value FROM test;")
+    sizes = [len(batch) for batch in cursor.iter_batches()]
+    assert sizes == [8, 8, 4]
+
+
+def test_cursor_fetchmany_end_of_data(cursor):
+    """fetchmany returns an empty list after the last row."""
+    cursor.execute("SELECT TOP 2 value FROM test;")
+    assert len(cursor.fetchmany(5)) == 2
+    assert cursor.fetchmany(5) == []
+
+
+def test_execute_null_binary_parameter(cursor):
+    """A leading NULL is bound with the type of the column it goes into."""
+    cursor.execute("CREATE TABLE #bin (value VARBINARY(16));")
+    cursor.execute("INSERT INTO #bin (value) VALUES (?);", (None,))
+    cursor.execute("INSERT INTO #bin (value) VALUES (?);", (b'\x01\x02',))
+    cursor.execute("SELECT value FROM #bin;")
+    assert cursor.fetchall() == [(None,), (b'\x01\x02',)]
+
+
+@pytest.mark.parametrize('value', [2 ** 63, -2 ** 63 - 1,
+                                   Decimal('NaN'), Decimal('Infinity')])
+def test_execute_parameter_out_of_range(cursor, value):
+    """Values that cannot be sent raise DataError."""
+    with pytest.raises(ffodbc.exceptions.DataError):
+        cursor.execute("SELECT ?;", (value,))
+
+
+def test_setinputsizes_leading_null(cursor):
+    """Declared sizes survive a leading NULL and later executes."""
+    cursor.setinputsizes([20])
+    cursor.execute("INSERT INTO test (value) VALUES (?);", (None,))
+    cursor.execute("INSERT INTO test (value) VALUES (?);", ('abc',))
+    param = cursor._params[0]
+    assert param.description.size == 20
+    cursor.execute("INSERT INTO test (value) VALUES (?);", ('abcdefg',))
+    assert cursor._params[0] is param
+
+
+def test_statement_cache(cursor):
+    """Parameters of recently used statements are bound again, not rebuilt."""
+    insert = "INSERT INTO test (value) VALUES (?);"
+    select = "SELECT COUNT(*) FROM test WHERE value = ?;"
+    cursor.prepare(insert)
+    cursor.execute(insert, ('cached',))
+    param = cursor._params[0]
+    cursor.execute(select, ('cached',))
+    cursor.execute(insert, ('cached',))
+    assert cursor._params[0] is param
+    cursor.execute(select, ('cached',))
+    assert cursor.fetchone() == (2,)
+
+
+def test_execute_long_parameters(cursor):
+    """Values longer than NVARCHAR(4000) and VARBINARY(8000) are sent."""
+    cursor.execute("CREATE TABLE #long (t NVARCHAR(MAX), b VARBINARY(MAX));")
+    cursor.execute("INSERT INTO #long (t, b) VALUES (?, ?);",
+                   ('x' * 5000, b'\x01' * 10000))
+    cursor.execute("INSERT INTO #long (t, b) VALUES (?, ?);",
+                   ('y', b'\x02'))
+    cursor.execute("SELECT LEN(t), DATALENGTH(b) FROM #long;")
+    assert cursor.fetchall() == [(5000, 10000), (1, 1)]
+
+
+def test_closed_cursor_async_calls(cursor):
+    """cancel, timeout and asynchronous raise on a closed cursor."""
+    cursor.close()
+    with pytest.raises(ffodbc.exceptions.ProgrammingError):
+        cursor.cancel()
+    with pytest.raises(ffodbc.exceptions.ProgrammingError):
+        cursor.timeout = 1
+    with pytest.raises(ffodbc.exceptions.ProgrammingError):
+        cursor.asynchronous = True
+
+
+def test_close_pending_cursor(connection):
+    """Closing a cursor with a statement still executing cancels it."""
+    cur = connection.cursor()
+    cur.asynchronous = True
+    cur.execute("WAITFOR DELAY '00:00:10';")
+    cur.close()
+    cur.close()
+
+
+def test_fetch_without_result_set(cursor):
+    """Fetching after a statement without a result set returns no rows."""
+    cursor.execute("INSERT INTO test (value) VALUES (N'no rows');")
+    assert cursor.fetchall() == []
+    assert cursor.fetchmany() == []
+    assert list(cursor) == []
+    assert cursor.fetchone() is None